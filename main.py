@@ -6,13 +6,17 @@ import logging
 import os.path
 import pathlib
 import random
+import re
+import struct
 import sys
-import threading
-import uuid
+import time
+import traceback
 import zipfile
-from concurrent.futures import ProcessPoolExecutor, as_completed, ThreadPoolExecutor
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from xml.etree import ElementTree
+from xml.sax import saxutils
 
 
 #  TODO: logging from multiple processes
@@ -35,6 +39,83 @@ def get_logger():
     return logging.getLogger('test-task')
 
 
+# Byte fragments of the fixed xml-file structure, used by TestObject.serialize
+_HEAD = b'<root><var name="id" value="'
+_MID1 = b'"/><var name="level" value="'
+_MID2 = b'"/><objects>'
+_OBJ_A = b'<object name="'
+_OBJ_B = b'"/>'
+_TAIL = b'</objects></root>'
+# Characters, which must be escaped in attribute values
+_ESCAPE_RE = re.compile(r'[&<>"]')
+# Escapes for attribute values in addition to &, < and >
+_ESCAPE_ENTITIES = {'"': '&quot;'}
+# Encoded values for the range of random levels
+_LEVEL_BYTES = {level: str(level).encode() for level in range(1, 101)}
+
+# Patterns for values of the fixed xml-file structure, used by parse_xml_string
+# Both quote styles are accepted, value is the last group
+_ID_RE = re.compile(rb'name\s*=\s*(["\'])id\1\s+value\s*=\s*(["\'])(.*?)\2', re.DOTALL)
+_LEVEL_RE = re.compile(rb'name\s*=\s*(["\'])level\1\s+value\s*=\s*(["\'])(.*?)\2', re.DOTALL)
+_NAME_RE = re.compile(rb'<object\s+name\s*=\s*(["\'])(.*?)\1', re.DOTALL)
+# Predefined xml entities and character references
+# Digits are limited, longer references are above the Unicode range anyway and kept as is
+_ENTITY_RE = re.compile(r'&(?:#0*([0-9]{1,8})|#x0*([0-9a-fA-F]{1,8})|(amp|lt|gt|quot|apos));')
+_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+
+def _encode_value(value):
+    """
+    Encode attribute value to xml bytes.
+    Hex strings have nothing to escape, so value is escaped only if it has special characters.
+    """
+    if not value.isalnum() and _ESCAPE_RE.search(value):
+        value = saxutils.escape(value, _ESCAPE_ENTITIES)
+    return value.encode()
+
+
+def _replace_entity(match):
+    """Returns character for matched xml entity or character reference"""
+    decimal, hexadecimal, name = match.groups()
+    if name:
+        return _ENTITIES[name]
+    code = int(decimal) if decimal else int(hexadecimal, 16)
+    if code > 0x10FFFF or 0xD800 <= code <= 0xDFFF:
+        return match.group(0)  # not a character, kept as is
+    return chr(code)
+
+
+def _decode_value(value):
+    """
+    Decode attribute value from xml bytes.
+    Entities never appear in hex strings, so value is unescaped only if it has them.
+    Only entities defined by xml are decoded, others are kept as is.
+    """
+    value = value.decode()
+    return _ENTITY_RE.sub(_replace_entity, value) if '&' in value else value
+
+
+def parse_xml_string(xml_string):
+    """
+    Parse xml string (bytes) of TestObject.
+    Structure is fixed, so values are extracted with regular expressions without building an element tree.
+
+    Returns
+    -------
+    Tuple of object_id, level and object_names
+    """
+    id_match = _ID_RE.search(xml_string)
+    if id_match is None:
+        raise ValueError("Xml string is missing id")
+    level_match = _LEVEL_RE.search(xml_string)
+    if level_match is None:
+        raise ValueError("Xml string is missing level")
+    object_id = _decode_value(id_match.group(3))
+    level = int(level_match.group(3))
+    object_names = [_decode_value(name) for _, name in _NAME_RE.findall(xml_string)]
+    return object_id, level, object_names
+
+
 class TestObject:
     """
     Object for xml-files
@@ -48,17 +129,15 @@ class TestObject:
     object_names : list(str)
         List of random strings for object names in xml-file. Generate new if None in init function parameters.
     """
+    __slots__ = ('object_id', 'level', 'object_names')
 
     def __init__(self, object_id=None, level=None, object_names=None):
-        self.object_id = object_id if object_id else RandomGenerator.get_unique_random_string()
-        self.level = level if level else random.randint(1, 100)
+        self.object_id = object_id if object_id is not None else RandomGenerator.get_random_string()
+        self.level = level if level is not None else random.randint(1, 100)
         if object_names is not None:
             self.object_names = object_names
         else:
-            self.object_names = [
-                RandomGenerator.get_random_string()
-                for _ in range(random.randint(1, 10))
-            ]
+            self.object_names = RandomGenerator.get_random_strings(random.randint(1, 10))
 
     def __str__(self):
         return f"TestObject ID={self.object_id} level={self.level}, objects={self.object_names}"
@@ -68,86 +147,166 @@ class TestObject:
 
     @classmethod
     def from_xml_string(cls, xml_string):
-        """Construct TestObject from xml string"""
-        xml_root = ElementTree.fromstring(xml_string)
-        object_id = xml_root[0].get("value")
-        level = xml_root[1].get("value")
-        xml_objects = xml_root[2]
-        object_names = []
-        for xml_obj in xml_objects.iter("object"):
-            object_names.append(xml_obj.get("name"))
+        """Construct TestObject from xml string (bytes)"""
+        object_id, level, object_names = parse_xml_string(xml_string)
         return cls(object_id=object_id, level=level, object_names=object_names)
 
     def serialize(self):
-        """Convert TestObject to xml string"""
-        root = ElementTree.Element("root")
-        ElementTree.SubElement(root, "var", attrib={"name": "id", "value": self.object_id})
-        ElementTree.SubElement(root, "var", attrib={"name": "level", "value": str(self.level)})
-        objects = ElementTree.SubElement(root, "objects")
-        for name in self.object_names:
-            ElementTree.SubElement(objects, "object", attrib={"name": name})
-        return ElementTree.tostring(root, xml_declaration=True)
+        """
+        Convert TestObject to xml string.
+        Structure is fixed, so xml is assembled from byte fragments without building an element tree.
+        ID and object names are escaped only if they have special characters, so hex strings are written as is.
+        """
+        return b''.join([
+            _HEAD, _encode_value(self.object_id), _MID1,
+            _LEVEL_BYTES.get(self.level) or str(self.level).encode(), _MID2,
+            *[part for name in self.object_names for part in (_OBJ_A, _encode_value(name), _OBJ_B)],
+            _TAIL,
+        ])
 
 
 class RandomGenerator:
     """
-    Class for string random generation
+    Class for string random generation.
+    Strings are hex of 128 random bits, so collisions are negligible
+    and generated strings are not stored for uniqueness checks.
     """
-    # Set for checking string uniqueness
-    unique_strings_generated = set()
+    # Number of random bytes in string
+    random_bytes_count = 16
 
-    @staticmethod
-    def get_random_string():
-        """Returns the random string, based on generated UUID4."""
-        return uuid.uuid4().hex
+    @classmethod
+    def get_random_string(cls):
+        """Returns the random hex string, based on os.urandom without UUID object construction."""
+        return os.urandom(cls.random_bytes_count).hex()
 
     @classmethod
-    def get_unique_random_string(cls):
-        """
-        Returns the random string, which is unique for the script run.
-        Saves generated string in self.unique_strings_generated
-        """
-        while True:
-            rand_str = cls.get_random_string()
-            if rand_str not in cls.unique_strings_generated:
-                cls.unique_strings_generated.add(rand_str)
-                return rand_str
+    def get_random_strings(cls, count):
+        """Returns a list of count random strings, using one os.urandom and one hex call for all of them."""
+        size = cls.random_bytes_count * 2  # length of hex string
+        random_hex = os.urandom(cls.random_bytes_count * count).hex()
+        return [random_hex[i:i + size] for i in range(0, size * count, size)]
 
     @classmethod
     def get_unique_random_strings(cls, count):
-        """
-        Returns a set of random strings, that are unique for the script run.
-        Saves generated strings in self.unique_strings_generated
-        """
-        old_strings = set(cls.unique_strings_generated)  # Copy previous strings
-        new_length = len(old_strings) + count
-        # Generating strings until the target length is reached
-        while len(cls.unique_strings_generated) < new_length:
-            rand_str = cls.get_random_string()
-            cls.unique_strings_generated.add(rand_str)
-        return cls.unique_strings_generated - old_strings  # Returns only new strings
+        """Returns a set of count unique random strings."""
+        new_strings = set(cls.get_random_strings(count))
+        # Generating more strings in the unlikely case of a collision
+        while len(new_strings) < count:
+            new_strings.add(cls.get_random_string())
+        return new_strings
+
+
+# Zip-file records, see section 4.3 of PKWARE APPNOTE.TXT
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_CENTRAL_HEADER_SIGNATURE = 0x02014b50
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_END_RECORD_SIGNATURE = 0x06054b50
+# Minimal version for DEFLATE, zip64 is not supported
+_ZIP_VERSION = 20
+_ZIP_MAX_COUNT = 0xFFFF
+_ZIP_MAX_SIZE = 0xFFFFFFFF
+
+
+class ZipWriter:
+    """
+    Minimal writer of zip-files from in-memory members.
+    Zipfile module does much per-member Python bookkeeping and compresses every member with a 32 KiB window,
+    which dominates for small xml-files. Here each member is compressed with the smallest window covering it
+    and records are packed with precompiled structs. Archives are ordinary zip-files without zip64.
 
+    Attributes
+    ----------
+    compress : bool
+        Compress members with DEFLATE, otherwise store them as is.
+    compresslevel : int
+        DEFLATE level.
+    """
 
-def create_testfile(object_id, file, lock):
+    def __init__(self, filename, compress=True, compresslevel=1):
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self._file = open(filename, "wb")
+        self._offset = 0
+        self._central_headers = list()
+        now = time.localtime()
+        self._dos_time = now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+        self._dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+        self._system = 0 if sys.platform == "win32" else 3
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def writestr(self, name, data):
+        """Write bytes data to zip-file as member with given name"""
+        if len(self._central_headers) >= _ZIP_MAX_COUNT:
+            raise ValueError("Too many members in zip-file, zip64 is not supported")
+        try:
+            name_bytes = name.encode("ascii")
+            flags = 0
+        except UnicodeEncodeError:
+            name_bytes = name.encode("utf-8")
+            flags = 0x800  # utf-8 name
+        crc = zlib.crc32(data)
+        if self.compress:
+            method = zipfile.ZIP_DEFLATED
+            wbits = max(9, min(15, len(data).bit_length()))
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -wbits)
+            content = compressor.compress(data) + compressor.flush()
+        else:
+            method = zipfile.ZIP_STORED
+            content = data
+        if self._offset + _LOCAL_HEADER.size + len(name_bytes) + len(content) > _ZIP_MAX_SIZE:
+            raise ValueError("Zip-file is too large, zip64 is not supported")
+        self._file.write(_LOCAL_HEADER.pack(
+            _LOCAL_HEADER_SIGNATURE, _ZIP_VERSION, flags, method, self._dos_time, self._dos_date,
+            crc, len(content), len(data), len(name_bytes), 0
+        ))
+        self._file.write(name_bytes)
+        self._file.write(content)
+        self._central_headers.append(_CENTRAL_HEADER.pack(
+            _CENTRAL_HEADER_SIGNATURE, self._system << 8 | _ZIP_VERSION, _ZIP_VERSION, flags, method,
+            self._dos_time, self._dos_date, crc, len(content), len(data), len(name_bytes), 0, 0, 0, 0,
+            0o600 << 16, self._offset
+        ) + name_bytes)
+        self._offset += _LOCAL_HEADER.size + len(name_bytes) + len(content)
+
+    def close(self):
+        """Write central directory and close zip-file"""
+        if self._file.closed:
+            return
+        try:
+            central_directory = b''.join(self._central_headers)
+            self._file.write(central_directory)
+            count = len(self._central_headers)
+            self._file.write(_END_RECORD.pack(
+                _END_RECORD_SIGNATURE, 0, 0, count, count, len(central_directory), self._offset, 0
+            ))
+        finally:
+            self._file.close()
+
+
+def serialize_testfile(object_id):
     """
-    Create TestObject for object_id, serialize it to xml and save to zip-file
+    Create TestObject for object_id and serialize it to xml
 
     Parameters
     ----------
     object_id : str
         Random generated unique string for Object ID
-    file : zipfile.ZipFile
-        Zip-file for saving
-    lock : threading.Lock
-        Lock for ensuring access to zip-file
+
+    Returns
+    -------
+    Tuple of xml-file name and xml string
     """
-    obj_xml_str = TestObject(object_id).serialize()
-    with lock:
-        file.writestr(f"{object_id}.xml", obj_xml_str)
-    return object_id
+    return f"{object_id}.xml", TestObject(object_id).serialize()
 
 
-def create_zipfile(name, object_ids, out_dir):
+def create_zipfile(name, xml_count, out_dir, compress=True):
     """
     Create zip-file and fill it with xml-files
 
@@ -155,35 +314,68 @@ def create_zipfile(name, object_ids, out_dir):
     ----------
     name : str
         Filename for zipfile
-    object_ids : list(str)
-        Random generated IDs for xml-files.
+    xml_count : int
+        Required number of xml-files in zip-file.
     out_dir : str
         Absolute path to output directory
+    compress : bool
+        Compress xml-files with DEFLATE, otherwise store them as is.
 
     Returns
     -------
-    Returns parameters back in dict
-    """
-    # Creating zip-file in memory
-    zip_buffer = io.BytesIO()
-    lock = threading.Lock()
-    with zipfile.ZipFile(zip_buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-        with ThreadPoolExecutor() as exe:  # using threads for memory copy
-            futures = [exe.submit(create_testfile, object_id, zf, lock) for object_id in object_ids]
-            # ThreadPoolExecutor wait for futures before shutdown
-    # Write zip buffer to file
-    # No need in multithreading. We are already in separate process
+    Returns name of created zip-file. Generated IDs are not returned, so they are not sent back to parent process.
+    """
+    # IDs are generated in worker process, collisions between zip-files are negligible
+    object_ids = RandomGenerator.get_unique_random_strings(xml_count)
+    # Writing zip-file directly to disk, without buffering whole archive in memory
     filename = os.path.join(out_dir, name)
-    with open(filename, "wb") as f:
-        f.write(zip_buffer.getvalue())
-    return {
-        "name": name,
-        "out_dir": out_dir,
-        "object_ids": object_ids
-    }
+    # Hex content gives the same compression ratio on the fastest level.
+    # Storing is faster still, but zip-files get about 1.5 times bigger
+    with ZipWriter(filename, compress=compress, compresslevel=1) as zf:
+        # Serializing and compressing hold the GIL, so threads would only add overhead.
+        # Parallelism is provided by processes in create_files
+        for object_id in object_ids:
+            zf.writestr(*serialize_testfile(object_id))
+    return name
 
 
-def create_files(zip_count, xml_count, out_dir):
+def get_workers_count(workers=None):
+    """
+    Returns number of worker processes.
+    If workers is None, it is chosen the same way as ProcessPoolExecutor does for max_workers=None.
+    """
+    if workers is not None:
+        return workers
+    workers_count = os.cpu_count() or 1
+    if sys.platform == "win32":
+        workers_count = min(workers_count, 61)  # ProcessPoolExecutor limit for Windows
+    return workers_count
+
+
+def get_chunksize(tasks_count, workers_count):
+    """
+    Returns chunksize for ProcessPoolExecutor.map, so each worker gets several chunks of tasks
+    and several tasks are sent to worker at once.
+    """
+    return max(1, tasks_count // (workers_count * 4))
+
+
+def _run_task(func, args):
+    """
+    Calls func(*args) in worker process for ProcessPoolExecutor.map.
+    Exception is returned instead of raised, because map stops on the first raised exception.
+
+    Returns
+    -------
+    Tuple of func result (None on fail) and formatted traceback (None on success)
+    """
+    try:
+        return func(*args), None
+    except Exception:
+        return None, traceback.format_exc().rstrip()
+
+
+def create_files(zip_count, xml_count, out_dir, exe, workers_count, compress=True):
     """
     Create files for task
 
@@ -195,80 +387,101 @@ def create_files(zip_count, xml_count, out_dir):
         Required number of xml-files in each zip-file.
     out_dir : str
         Absolute path to output directory.
+    exe : concurrent.futures.ProcessPoolExecutor
+        Pool of worker processes.
+    workers_count : int
+        Number of worker processes in pool.
+    compress : bool
+        Compress xml-files in zip-files.
 
     Returns
     -------
     Returns back parameters in list
     """
-    # Generating objects ids beforehand
-    all_object_ids = RandomGenerator.get_unique_random_strings(zip_count * xml_count)
-    object_ids_iter = iter(all_object_ids)
+    # Object IDs are generated by workers, so only small arguments are sent to them
+    zip_args = [(f"{i + 1}.zip", xml_count, out_dir, compress) for i in range(0, zip_count)]
     files_created = 0
-    # Compressing is CPU-bound, so using processes
-    with ProcessPoolExecutor() as exe:
-        futures = list()
-        for i in range(0, zip_count):
-            objects_ids = list(itertools.islice(object_ids_iter, xml_count))  # get chunk of ids from set iterator
-            futures.append(exe.submit(create_zipfile, f"{i + 1}.zip", objects_ids, out_dir))
-        for future in as_completed(futures):
-            try:
-                res = future.result()
-                files_created += 1
-                get_logger().debug(f"{res['name']} is created")
-            except Exception as e:  # very basic exception handling
-                get_logger().exception("Zip-file creation failed", exc_info=e)
+    logger = get_logger()
+    debug = logger.isEnabledFor(logging.DEBUG)  # skip formatting of debug messages if they are not logged
+    try:
+        # Compressing is CPU-bound, so using processes
+        tasks = exe.map(_run_task, itertools.repeat(create_zipfile), zip_args,
+                        chunksize=get_chunksize(zip_count, workers_count))
+        for res, error in tasks:
+            if error:  # very basic exception handling
+                logger.error(f"Zip-file creation failed\n{error}")
+                continue
+            files_created += 1
+            if debug:
+                logger.debug(f"{res} is created")
+    except BrokenProcessPool as e:  # worker process died, results of the remaining tasks are lost
+        logger.exception("Zip-file creation failed", exc_info=e)
     return files_created
 
 
-def create_levels_file(test_objects, out_dir):
+# Write buffer size for csv-files
+_CSV_BUFFER_SIZE = 1 << 20
+
+
+def write_levels(test_objects, csvfile):
     """
-    Create levels.csv
+    Write levels.csv rows
 
     Parameters
     ----------
-    test_objects : list(TestObject)
-        List with parsed objects for processing
-    out_dir : str
-        Absolute path to output directory.
+    test_objects : list(tuple)
+        List with parsed (object_id, level, object_names) tuples for processing
+    csvfile : file object
+        Text stream for writing rows, opened with newline=''
+    """
+    levels_writer = csv.writer(csvfile)
+    levels_writer.writerows((object_id, level) for object_id, level, _ in test_objects)
 
-    Returns
-    -------
-    Returns filename of created csv-file
+
+def write_names(test_objects, csvfile):
     """
-    filename = os.path.join(out_dir, "levels.csv")
-    with open(filename, 'w', newline='') as csvfile:
-        levels_writer = csv.writer(csvfile)
-        for test_object in test_objects:
-            levels_writer.writerow([test_object.object_id, test_object.level])
-    return filename
+    Write names.csv rows
+
+    Parameters
+    ----------
+    test_objects : list(tuple)
+        List with parsed (object_id, level, object_names) tuples for processing
+    csvfile : file object
+        Text stream for writing rows, opened with newline=''
+    """
+    names_writer = csv.writer(csvfile)
+    names_writer.writerows(
+        (object_id, name) for object_id, _, object_names in test_objects for name in object_names
+    )
 
 
-def create_names_file(test_objects, out_dir):
+def extract_test_objects(zip_path):
     """
-    Create names.csv
+    Unpack and parse xml-files from zip-file
 
     Parameters
     ----------
-    test_objects : list(TestObject)
-        List with parsed objects for processing
-    out_dir : str
-        Absolute path to output directory.
+    zip_path : str
+        Absolute path to zip-file.
 
     Returns
     -------
-    Returns filename of created csv-file
+    List with unpacked (object_id, level, object_names) tuples for processing.
+    TestObject instances are not constructed, only their values are needed for csv-files.
     """
-    filename = os.path.join(out_dir, "names.csv")
-    with open(filename, 'w', newline='') as csvfile:
-        names_writer = csv.writer(csvfile)
-        for test_object in test_objects:
-            for name in test_object.object_names:
-                names_writer.writerow([test_object.object_id, name])
+    test_objects = list()
+    # Parsing holds the GIL, so no threads here. Parallelism is provided by processes in parse_files.
+    # Xml-files are read one by one, so only one decompressed xml is kept in memory
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in zf.infolist():
+            with zf.open(info) as xml_file:
+                test_objects.append(parse_xml_string(xml_file.read()))
+    return test_objects
 
 
-def extract_test_objects(zip_path):
+def parse_zipfile(zip_path):
     """
-    Parse files and create csv-files for task
+    Parse zip-file and create parts of csv-files for its xml-files
 
     Parameters
     ----------
@@ -280,25 +493,26 @@ def extract_test_objects(zip_path):
     Dict with:
         filename : str
             Absolute path to processed zip-file.
-        test_objects : list(TestObject)
-            List with unpacked objects for processing
+        levels : bytes
+            Rows of levels.csv
+        names : bytes
+            Rows of names.csv
     """
-    with zipfile.ZipFile(zip_path, 'r') as zf:
-        xml_files = [zf.read(name) for name in zf.namelist()]
-    test_objects = list()
-    with ThreadPoolExecutor() as exe:
-        futures = list()
-        for xml in xml_files:
-            futures.append(exe.submit(TestObject.from_xml_string, xml))
-        for future in as_completed(futures):
-            test_objects.append(future.result())
+    test_objects = extract_test_objects(zip_path)
+    # Csv rows are formatted and encoded in worker process,
+    # so only two byte strings are sent back and parent process just appends them to csv-files
+    levels_buffer = io.StringIO(newline='')
+    write_levels(test_objects, levels_buffer)
+    names_buffer = io.StringIO(newline='')
+    write_names(test_objects, names_buffer)
     return {
         "filename": zip_path,
-        "test_objects": test_objects
+        "levels": levels_buffer.getvalue().encode(),
+        "names": names_buffer.getvalue().encode()
     }
 
 
-def parse_files(src_dir, out_dir):
+def parse_files(src_dir, out_dir, exe, workers_count):
     """
     Parse files and create csv-files for task
 
@@ -308,47 +522,56 @@ def parse_files(src_dir, out_dir):
         Absolute path to output directory.
     out_dir : str
         Absolute path to output directory.
+    exe : concurrent.futures.ProcessPoolExecutor
+        Pool of worker processes.
+    workers_count : int
+        Number of worker processes in pool.
 
     Returns
     -------
     Tuple of file_processed and file_created counters
     """
-    test_objects = list()
-    # collect filepaths of zip-files
-    filepaths = [os.path.join(src_dir, f) for f in os.listdir(src_dir) if
-                 os.path.isfile(os.path.join(src_dir, f)) and f.endswith('.zip')]
+    # collect filepaths of zip-files, scandir provides file type without extra stat calls
+    with os.scandir(src_dir) as entries:
+        filepaths = [entry.path for entry in entries if entry.is_file() and entry.name.endswith('.zip')]
     files_processed = 0
-    # Decompressing is CPU-bound, so using processes
-    with ProcessPoolExecutor() as exe:
-        futures = list()
-        for filepath in filepaths:
-            futures.append(exe.submit(extract_test_objects, filepath))
-        for future in as_completed(futures):
-            try:
-                res = future.result()
-                # save parsed objects for future processing
-                test_objects.extend(res["test_objects"])
-                files_processed += 1
-                get_logger().debug(f"{res['filename']} is parsed")
-            except Exception as e:  # very basic exception handling
-                get_logger().exception("Zip-file creation failed", exc_info=e)
-    # Processing parsed objects and creating csv-files
-    get_logger().info("Processing objects and creating csv-files")
     files_created = 0
-    # Writing to file is IO-bound, so using threads
-    with ThreadPoolExecutor(2) as exe:
-        csv_futures = list()
-        csv_futures.append(exe.submit(create_levels_file, test_objects, out_dir))
-        csv_futures.append(exe.submit(create_names_file, test_objects, out_dir))
-        for future in as_completed(csv_futures):
-            try:
-                future.result()
-                files_created += 1
-            except Exception as e:  # very basic exception handling
-                get_logger().exception("Zip-file creation failed", exc_info=e)
+    levels_filename = os.path.join(out_dir, "levels.csv")
+    names_filename = os.path.join(out_dir, "names.csv")
+    logger = get_logger()
+    debug = logger.isEnabledFor(logging.DEBUG)  # skip formatting of debug messages if they are not logged
+    try:
+        with open(levels_filename, 'wb', buffering=_CSV_BUFFER_SIZE) as levels_file, \
+                open(names_filename, 'wb', buffering=_CSV_BUFFER_SIZE) as names_file:
+            # Decompressing is CPU-bound, so using processes
+            tasks = exe.map(_run_task, itertools.repeat(parse_zipfile), zip(filepaths),
+                            chunksize=get_chunksize(len(filepaths), workers_count))
+            for res, error in tasks:
+                if error:  # very basic exception handling
+                    logger.error(f"Zip-file parsing failed\n{error}")
+                    continue
+                # append parts of csv-files created by worker
+                levels_file.write(res["levels"])
+                names_file.write(res["names"])
+                files_processed += 1
+                if debug:
+                    logger.debug(f"{res['filename']} is parsed")
+        files_created = 2  # levels.csv and names.csv are completely written
+    except BrokenProcessPool as e:  # worker process died, so csv-files are incomplete
+        logger.exception("Zip-file parsing failed", exc_info=e)
+    except OSError as e:  # very basic exception handling
+        logger.exception("Csv-files creation failed", exc_info=e)
     return files_processed, files_created
 
 
+def positive_int(value):
+    """Argument type for integers greater than 0"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
 def init_argparse():
     parser = argparse.ArgumentParser(
         description="Create zip archives with xml files or parse directory with zip-archives and create csv files "
@@ -358,12 +581,16 @@ def init_argparse():
     parser.add_argument('-c', '--create', action='store_true')
     parser.add_argument("-z", "--zip-count", action='store', type=int, default=50)
     parser.add_argument("-x", "--xml-count", action='store', type=int, default=100)
+    parser.add_argument("-n", "--no-compression", action='store_true')
 
     parser.add_argument('-p', '--parse', action='store_true')
 
     parser.add_argument('-s', '--source-dir', action='store', default='./out')
     parser.add_argument('-o', '--output-dir', action='store', default='./out')
 
+    # None chooses number of workers the same way as ProcessPoolExecutor does
+    parser.add_argument('-w', '--workers', action='store', type=positive_int, default=None)
+
     parser.add_argument('-v', '--verbose', action='store_true')
 
     return parser
@@ -377,24 +604,30 @@ def main():
     # Initializing logger
     logger = init_logger(logging.DEBUG if args.verbose else logging.INFO)
 
-    if args.parse:
-        # Construct absolute paths
-        src_dir = os.path.abspath(args.source_dir)
-        if not os.path.exists(src_dir) or not os.path.isdir(src_dir):
-            logger.error(f"Source directory {src_dir} is invalid")
-            return
-        out_dir = os.path.abspath(args.output_dir)
-        pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)  # make output directory
-        logger.info(f"Parsing zip-files from {src_dir}")
-        file_processed, file_created = parse_files(src_dir, out_dir)  # do parsing
-        logger.info(f"{file_processed} zip-files are parsed, {file_created} csv-files are created in {out_dir}")
-    else:  # creating is default option
-        # Construct absolute path
-        out_dir = os.path.abspath(args.output_dir)
-        pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)  # make output directory
-        logger.info(f"Creating {args.zip_count} zip-files with {args.xml_count} xml-files in each")
-        files_created = create_files(args.zip_count, args.xml_count, out_dir)  # do creating
-        logger.info(f"{files_created} zip-files with {args.xml_count} xml-files in each are created in {out_dir}")
+    # Worker processes are started once and shared by creating and parsing
+    workers_count = get_workers_count(args.workers)
+    with ProcessPoolExecutor(workers_count) as exe:
+        if args.create or not args.parse:  # creating is default option
+            # Construct absolute path
+            out_dir = os.path.abspath(args.output_dir)
+            pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)  # make output directory
+            logger.info(f"Creating {args.zip_count} zip-files with {args.xml_count} xml-files in each")
+            # do creating
+            files_created = create_files(
+                args.zip_count, args.xml_count, out_dir, exe, workers_count, compress=not args.no_compression
+            )
+            logger.info(f"{files_created} zip-files with {args.xml_count} xml-files in each are created in {out_dir}")
+        if args.parse:
+            # Construct absolute paths
+            src_dir = os.path.abspath(args.source_dir)
+            if not os.path.exists(src_dir) or not os.path.isdir(src_dir):
+                logger.error(f"Source directory {src_dir} is invalid")
+                return
+            out_dir = os.path.abspath(args.output_dir)
+            pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)  # make output directory
+            logger.info(f"Parsing zip-files from {src_dir}")
+            file_processed, file_created = parse_files(src_dir, out_dir, exe, workers_count)  # do parsing
+            logger.info(f"{file_processed} zip-files are parsed, {file_created} csv-files are created in {out_dir}")
 
 
 if __name__ == "__main__":